@@ -1,14 +1,14 @@
 import streamlit as st
 import sys
 import os
-import time  # NEWLY ADDED
 
 # Add src to path
 sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
 
 from rag_chatbot import RAGChatbot
-# Import relevant functions from vector_store.py
-from vector_store import build_vector_database  # NEWLY ADDED
+# Background ingestion keeps the vector database up to date
+from ingestion_worker import IngestionWorker
+from session_store import SessionStore
 
 # Page configuration
 st.set_page_config(
@@ -50,30 +50,38 @@ DB_DIRECTORY = "chroma_db"
 def load_chatbot():
     """
     Loads and caches the chatbot.
-    If 'chroma_db' directory doesn't exist, it builds the database.
+    The vector database is built and kept up to date by a background
+    ingestion worker, so the first user is never blocked by indexing.
     """
-
-    # Step 1: Check if the database exists and build if necessary
     if not os.path.exists(DB_DIRECTORY):
-        st.info("First run: Building vector database... (This may take 1-2 minutes)")
-        print("Streamlit Cloud: 'chroma_db' not found, calling build_vector_database()")
-
-        start_time = time.time()
-
-        # Call the function imported from vector_store.py
-        build_vector_database()
-
-        end_time = time.time()
-        st.success(f"Database built successfully! ({end_time - start_time:.2f} seconds)")
-        print(f"Streamlit Cloud: Database built. ({end_time - start_time:.2f} seconds)")
+        print("Streamlit Cloud: 'chroma_db' not found, ingestion worker will build it")
     else:
         print("Streamlit Cloud: Found and loaded existing 'chroma_db' database.")
 
-    # Step 2: Load the chatbot after ensuring the database is ready
     chatbot = RAGChatbot()
     return chatbot
 
 
+@st.cache_resource
+def load_ingestion_worker(_chatbot):
+    """
+    Starts one ingestion worker that watches 'data/' and hot-swaps
+    new index generations into the chatbot.
+    """
+    worker = IngestionWorker(_chatbot)
+    worker.start()
+    return worker
+
+
+@st.cache_resource
+def load_session_store():
+    """
+    Loads the session store shared by all user sessions.
+    Memory is bounded per session and across the whole server.
+    """
+    return SessionStore()
+
+
 # Header
 st.markdown('<div class="main-header">🏥 Turkish Health Tourism Assistant</div>', unsafe_allow_html=True)
 st.markdown('<div class="sub-header">Ask me anything about health tourism in Turkey!</div>', unsafe_allow_html=True)
@@ -110,19 +118,37 @@ with st.sidebar:
 
 # --- (Main chat interface - No changes) ---
 try:
-    # This function now also checks/builds the database
     chatbot = load_chatbot()
-    st.success("✅ Chatbot is ready!")  # Updated message
+    load_ingestion_worker(chatbot)
+    if chatbot.vector_store.collection.count() == 0:
+        st.info("Building the knowledge base in the background... "
+                "Answers will use the documents as soon as it is ready.")
+    else:
+        st.success("✅ Chatbot is ready!")  # Updated message
 except Exception as e:
     st.error(f"❌ Critical error loading chatbot: {e}")
     st.stop()
 
-# Initialize chat history
-if "messages" not in st.session_state:
-    st.session_state.messages = []
+# Show how many duplicate searches/LLM calls were coalesced
+dedup_stats = chatbot.get_dedup_stats()
+st.sidebar.caption(
+    f"⚡ Deduplicated calls saved: {dedup_stats['saved']} "
+    f"of {dedup_stats['requests']}"
+)
+
+# Initialize chat session (history lives in the bounded session store)
+session_store = load_session_store()
+if "session_id" not in st.session_state:
+    st.session_state.session_id = session_store.new_session_id()
+session_id = st.session_state.session_id
+
+# Display chat history: the store keeps a bounded window of recent
+# messages, older turns are shown as a one-line summary
+transcript = session_store.get_history(session_id, max_turns=None)
+if transcript['summary']:
+    st.caption(f"Earlier in this conversation: {transcript['summary']}")
 
-# Display chat history
-for message in st.session_state.messages:
+for message in transcript['messages']:
     with st.chat_message(message["role"]):
         st.markdown(message["content"])
         if "sources" in message:
@@ -130,9 +156,12 @@ for message in st.session_state.messages:
                 st.write(", ".join(message["sources"]))
 
 # Chat input
-if prompt := st.chat_input("Ask your question here..."):
+if prompt := st.chat_input("Ask your question here...", max_chars=2000):
+    # History before this question, used to resolve follow-ups
+    history = session_store.get_history(session_id)
+
     # Add user message
-    st.session_state.messages.append({"role": "user", "content": prompt})
+    session_store.add_message(session_id, "user", prompt)
 
     # Display user message
     with st.chat_message("user"):
@@ -140,26 +169,23 @@ if prompt := st.chat_input("Ask your question here..."):
 
     # Generate response
     with st.chat_message("assistant"):
-        with st.spinner("Thinking..."):
-            try:
-                result = chatbot.get_answer(prompt)
-
-                # Display answer
-                st.markdown(result['answer'])
-
-                # Display sources
-                with st.expander("📚 View Sources"):
-                    st.write(", ".join(result['sources']))
-
-                # Save to history
-                st.session_state.messages.append({
-                    "role": "assistant",
-                    "content": result['answer'],
-                    "sources": result['sources']
-                })
-
-            except Exception as e:
-                st.error(f"Error generating answer: {e}")
+        try:
+            with st.spinner("Thinking..."):
+                result = chatbot.stream_answer(prompt, history=history)
+
+            # Display answer as it streams (shared with identical concurrent questions)
+            answer = st.write_stream(result['answer_stream'])
+
+            # Display sources
+            with st.expander("📚 View Sources"):
+                st.write(", ".join(result['sources']))
+
+            # Save to history
+            session_store.add_message(session_id, "assistant",
+                                      answer, result['sources'])
+
+        except Exception as e:
+            st.error(f"Error generating answer: {e}")
 
 # --- (Footer - No changes) ---
 st.markdown("---")
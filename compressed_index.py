@@ -0,0 +1,456 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from typing import List, Dict, Optional, Tuple
+import numpy as np
+
+SUPPORTED_DTYPES = ("float32", "float16", "int8")
+
+
+class CompressedIndex:
+    """
+    In-memory vector index stored as float16 or int8 codes,
+    with an optional PCA projection learned at build time
+    """
+
+    def __init__(self, ids: List[str], codes: np.ndarray, dtype: str,
+                 scales: Optional[np.ndarray] = None,
+                 pca_mean: Optional[np.ndarray] = None,
+                 pca_components: Optional[np.ndarray] = None,
+                 requested_pca_dim: Optional[int] = None):
+        """
+        Initialize compressed index (use CompressedIndex.build to create one)
+
+        Args:
+            ids: Document ids, one per row of codes
+            codes: Compressed vectors
+            dtype: Storage type, one of SUPPORTED_DTYPES
+            scales: Per-dimension scales for int8 codes
+            pca_mean: Mean vector subtracted before projection
+            pca_components: PCA projection matrix (reduced_dim x original_dim)
+            requested_pca_dim: pca_dim asked for at build time; the projection
+                may be smaller, or absent, for small or low-dimensional data
+        """
+        self.ids = list(ids)
+        self.codes = codes
+        self.dtype = dtype
+        self.scales = scales
+        self.pca_mean = pca_mean
+        self.pca_components = pca_components
+        self.requested_pca_dim = requested_pca_dim
+
+    @classmethod
+    def build(cls, ids: List[str], embeddings, dtype: str = "int8",
+              pca_dim: Optional[int] = None) -> "CompressedIndex":
+        """
+        Build a compressed index from full precision embeddings
+
+        Args:
+            ids: Document ids
+            embeddings: Full precision embeddings (n x dim)
+            dtype: Storage type, one of SUPPORTED_DTYPES
+            pca_dim: Reduce vectors to this many dimensions with PCA
+
+        Returns:
+            Compressed index
+        """
+        if dtype not in SUPPORTED_DTYPES:
+            raise ValueError(f"Unsupported dtype '{dtype}', use one of {SUPPORTED_DTYPES}")
+
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        pca_mean = pca_components = None
+
+        if pca_dim is not None and pca_dim < vectors.shape[1]:
+            # Learn the projection from the indexed vectors themselves
+            pca_mean = vectors.mean(axis=0)
+            _, _, vt = np.linalg.svd(vectors - pca_mean, full_matrices=False)
+            pca_components = vt[:pca_dim].astype(np.float32)
+
+        index = cls(ids, None, dtype, pca_mean=pca_mean, pca_components=pca_components,
+                    requested_pca_dim=pca_dim)
+        vectors = index._prepare(vectors)
+
+        if dtype == "int8":
+            # Symmetric scalar quantization with one scale per dimension
+            scales = np.abs(vectors).max(axis=0) / 127.0
+            scales[scales == 0] = 1.0
+            index.scales = scales.astype(np.float32)
+            index.codes = np.clip(np.round(vectors / scales), -127, 127).astype(np.int8)
+        else:
+            index.codes = vectors.astype(dtype)
+
+        return index
+
+    @classmethod
+    def load(cls, path: str) -> "CompressedIndex":
+        """
+        Load a compressed index saved with save()
+        """
+        data = np.load(path, allow_pickle=False)
+        return cls(
+            ids=data['ids'].tolist(),
+            codes=data['codes'],
+            dtype=str(data['dtype']),
+            scales=data['scales'] if 'scales' in data else None,
+            pca_mean=data['pca_mean'] if 'pca_mean' in data else None,
+            pca_components=data['pca_components'] if 'pca_components' in data else None,
+            requested_pca_dim=int(data['pca_dim']) if 'pca_dim' in data else None
+        )
+
+    def save(self, path: str) -> None:
+        """
+        Save the compressed index to a .npz file
+        """
+        arrays = {'ids': np.array(self.ids), 'codes': self.codes, 'dtype': np.array(self.dtype)}
+        for name in ('scales', 'pca_mean', 'pca_components'):
+            value = getattr(self, name)
+            if value is not None:
+                arrays[name] = value
+        if self.requested_pca_dim is not None:
+            arrays['pca_dim'] = np.array(self.requested_pca_dim)
+        np.savez(path, **arrays)
+
+    def search(self, query_embedding, n_results: int = 3,
+               block_size: int = 4096) -> Tuple[List[str], List[float]]:
+        """
+        Score a query directly against the compressed vectors
+
+        Args:
+            query_embedding: Full precision query embedding
+            n_results: Number of results to return
+            block_size: Rows decoded at a time, bounds temporary memory
+
+        Returns:
+            Tuple of (ids, cosine similarities) best first
+        """
+        rows, scores = self.search_rows(query_embedding, n_results, block_size)
+        return [self.ids[i] for i in rows], scores
+
+    def search_rows(self, query_embedding, n_results: int = 3,
+                    block_size: int = 4096) -> Tuple[List[int], List[float]]:
+        """
+        Like search(), but returns row numbers instead of ids
+
+        Returns:
+            Tuple of (row numbers, cosine similarities) best first
+        """
+        query = self._prepare(np.asarray(query_embedding, dtype=np.float32)[None, :])[0]
+        if self.scales is not None:
+            # Fold the int8 scales into the query instead of decoding the codes
+            query = query * self.scales
+
+        scores = np.empty(len(self.ids), dtype=np.float32)
+        for start in range(0, len(self.ids), block_size):
+            block = self.codes[start:start + block_size].astype(np.float32)
+            scores[start:start + block_size] = block @ query
+
+        n_results = min(n_results, len(self.ids))
+        if n_results == 0:
+            return [], []
+        top = np.argpartition(-scores, n_results - 1)[:n_results]
+        top = top[np.argsort(-scores[top])]
+        return top.tolist(), scores[top].tolist()
+
+    def memory_bytes(self) -> int:
+        """
+        Memory used by the vectors and the decoding parameters
+        """
+        total = self.codes.nbytes
+        for value in (self.scales, self.pca_mean, self.pca_components):
+            if value is not None:
+                total += value.nbytes
+        return total
+
+    def _prepare(self, vectors: np.ndarray) -> np.ndarray:
+        # Project (if PCA is used) and L2-normalize so dot product is cosine
+        if self.pca_components is not None:
+            vectors = (vectors - self.pca_mean) @ self.pca_components.T
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return (vectors / norms).astype(np.float32)
+
+
+def append_exact_vectors(path: str, ids: List[str], embeddings) -> None:
+    """
+    Append full precision vectors to the on-disk file used for re-scoring
+
+    The vectors are raw float32 rows; a JSON lines file next to them holds
+    the dimension on its first line and then one id per row. Both files
+    are only appended to, so each call writes just the new rows. Serving
+    processes memory-map the vectors instead of loading Chroma's float32
+    vector index.
+
+    Args:
+        path: Path of the raw vector file
+        ids: Ids of the new vectors
+        embeddings: New full precision vectors
+    """
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    ids_path = exact_ids_path(path)
+    new_file = not os.path.exists(ids_path)
+
+    # Vectors first: a failure in between leaves rows without ids, which
+    # load_exact_vectors ignores
+    with open(path, "ab") as f:
+        f.write(embeddings.tobytes())
+    with open(ids_path, "a", encoding="utf-8") as f:
+        if new_file:
+            f.write(json.dumps({'dim': embeddings.shape[1]}) + "\n")
+        f.writelines(json.dumps(chunk_id) + "\n" for chunk_id in ids)
+
+
+def load_exact_vectors(path: str) -> Tuple[List[str], Optional[np.ndarray]]:
+    """
+    Memory-map the full precision vectors written by append_exact_vectors
+
+    Returns:
+        Tuple of (ids, read-only memmap), or ([], None) if the files are
+        missing or incomplete
+    """
+    ids_path = exact_ids_path(path)
+    if not (os.path.exists(path) and os.path.exists(ids_path)):
+        return [], None
+
+    with open(ids_path, encoding="utf-8") as f:
+        dim = json.loads(f.readline())['dim']
+        ids = [json.loads(line) for line in f]
+    if not ids or os.path.getsize(path) < len(ids) * dim * 4:
+        return [], None
+    return ids, np.memmap(path, dtype=np.float32, mode='r', shape=(len(ids), dim))
+
+
+def exact_ids_path(path: str) -> str:
+    """
+    Path of the ids file belonging to an exact vector file
+    """
+    return os.path.splitext(path)[0] + ".ids.jsonl"
+
+
+def resident_bytes() -> Optional[int]:
+    """
+    Resident memory of the current process (Linux), None elsewhere
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def exact_search(embeddings: np.ndarray, query_embedding, n_results: int = 3) -> np.ndarray:
+    """
+    Brute-force cosine search over full precision embeddings
+
+    Returns:
+        Row indices of the best matches, best first
+    """
+    scores = rescore(embeddings, query_embedding)
+    return np.argsort(-scores)[:n_results]
+
+
+def rescore(candidate_embeddings, query_embedding) -> np.ndarray:
+    """
+    Exact cosine scores of candidate embeddings for a query
+
+    Returns:
+        Similarity of each candidate, in candidate order
+    """
+    vectors = np.asarray(candidate_embeddings, dtype=np.float32)
+    vectors = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    query = np.asarray(query_embedding, dtype=np.float32)
+    return vectors @ (query / np.linalg.norm(query))
+
+
+def compression_report(ids: List[str], embeddings, query_embeddings,
+                       n_results: int = 3, rescore_factor: int = 4,
+                       configs: Optional[List[Dict]] = None,
+                       measured_bytes: Optional[Dict] = None) -> List[Dict]:
+    """
+    Compare memory use and recall of compressed indexes against exact search
+
+    Args:
+        ids: Document ids
+        embeddings: Full precision document embeddings
+        query_embeddings: Embeddings of sample queries
+        n_results: k used for recall@k
+        rescore_factor: Candidates per result re-scored exactly
+        configs: CompressedIndex.build keyword arguments to compare
+        measured_bytes: Resident memory measured for each serving path, keyed
+            by 'chroma' and by config index (see measure_serving_memory)
+
+    Returns:
+        One row per config with memory and recall figures
+    """
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    if configs is None:
+        configs = [
+            {'dtype': 'float16'},
+            {'dtype': 'int8'},
+            {'dtype': 'int8', 'pca_dim': 128},
+        ]
+
+    baseline_bytes = embeddings.nbytes
+    expected = [set(ids[i] for i in exact_search(embeddings, q, n_results))
+                for q in query_embeddings]
+
+    positions = {doc_id: i for i, doc_id in enumerate(ids)}
+    total = max(len(expected) * n_results, 1)
+
+    rows = []
+    for config in configs:
+        index = CompressedIndex.build(ids, embeddings, **config)
+        hits = rescored_hits = 0
+        for query, truth in zip(query_embeddings, expected):
+            found, _ = index.search(query, n_results=n_results)
+            hits += len(truth.intersection(found))
+
+            candidates, _ = index.search(query, n_results=n_results * rescore_factor)
+            exact = rescore(embeddings[[positions[c] for c in candidates]], query)
+            best = [candidates[i] for i in np.argsort(-exact)[:n_results]]
+            rescored_hits += len(truth.intersection(best))
+
+        memory = index.memory_bytes()
+        row = {
+            'config': config,
+            'memory_bytes': memory,
+            'baseline_bytes': baseline_bytes,
+            'recall': hits / total,
+            'recall_rescored': rescored_hits / total
+        }
+        if measured_bytes:
+            row['measured_bytes'] = measured_bytes.get(len(rows))
+            row['measured_baseline_bytes'] = measured_bytes.get('chroma')
+        rows.append(row)
+    return rows
+
+
+def print_compression_report(rows: List[Dict]) -> None:
+    """
+    Print the output of compression_report as a table
+    """
+    print("\n" + "=" * 50)
+    print("COMPRESSED INDEX REPORT")
+    print("=" * 50)
+    print("Vectors: compressed size vs a float32 array of the same vectors")
+    print("Resident: memory a fresh process adds on its first search")
+    for row in rows:
+        config = ", ".join(f"{key}={value}" for key, value in row['config'].items())
+        line = (f"{config:<26} vectors {row['memory_bytes'] / 1024:>7.1f} KB "
+                f"({1 - row['memory_bytes'] / row['baseline_bytes']:.0%} smaller)")
+        if row.get('measured_bytes') is not None:
+            line += f"  resident {row['measured_bytes'] / 1024:>8.1f} KB"
+        print(line + f"  recall {row['recall']:.2f}  rescored {row['recall_rescored']:.2f}")
+
+    baseline = f"{'float32 (array)':<26} vectors {rows[0]['baseline_bytes'] / 1024:>7.1f} KB"
+    if rows[0].get('measured_baseline_bytes') is not None:
+        baseline += (f"         Chroma resident "
+                     f"{rows[0]['measured_baseline_bytes'] / 1024:>8.1f} KB")
+    print(baseline)
+    print("=" * 50)
+
+
+def measure_serving_memory(config: Optional[Dict] = None,
+                           collection_name: Optional[str] = None,
+                           index_directory: Optional[str] = None) -> Optional[int]:
+    """
+    Measure the resident memory a serving path adds, in a fresh process
+
+    The child process loads the embedding model first, then measures how
+    much resident memory the first search adds: Chroma's own vector index
+    when config is None, otherwise the compressed index (codes in memory,
+    exact vectors memory-mapped and touched only for re-scored candidates).
+
+    Args:
+        config: CompressedIndex.build keyword arguments, None for plain Chroma
+        collection_name: Collection to measure, defaults to the active one
+        index_directory: Directory holding 'index.npz' and the exact vector
+            files for config, as written by report_index_files
+
+    Returns:
+        Bytes of resident memory added, or None if it could not be measured
+    """
+    config = config or {}
+    args = [sys.executable, os.path.abspath(__file__), "--measure",
+            config.get('dtype', 'chroma'), collection_name or "", index_directory or ""]
+    result = subprocess.run(args, capture_output=True, text=True)
+    lines = result.stdout.strip().splitlines()
+    if result.returncode != 0 or not lines or lines[-1] == "None":
+        return None
+    return int(lines[-1])
+
+
+def report_index_files(directory: str, ids: List[str], embeddings, config: Dict) -> str:
+    """
+    Write a compressed index and its exact vectors for one report config
+
+    The files go to a directory of their own, so the report never touches
+    the files the app serves from.
+
+    Returns:
+        The directory, for measure_serving_memory
+    """
+    os.makedirs(directory, exist_ok=True)
+    CompressedIndex.build(ids, embeddings, **config).save(os.path.join(directory, "index.npz"))
+    append_exact_vectors(os.path.join(directory, "exact.f32"), ids, embeddings)
+    return directory
+
+
+def _measure_child(dtype: str, collection_name: str, index_directory: str) -> None:
+    from vector_store import VectorStore
+
+    # Load the model and the client before measuring
+    store = VectorStore(collection_name=collection_name or None)
+    store.embedding_model.encode(["warm up"])
+    before = resident_bytes()
+
+    if dtype != "chroma":
+        # Serve from the report's files; documents still come from Chroma
+        store.compression = dtype
+        store.compressed_index = CompressedIndex.load(os.path.join(index_directory, "index.npz"))
+        _, store.exact_vectors = load_exact_vectors(os.path.join(index_directory, "exact.f32"))
+    store.search("health tourism in Turkey")
+
+    after = resident_bytes()
+    print(None if before is None or after is None else after - before)
+
+
+# Main execution
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--measure":
+        _measure_child(sys.argv[2], sys.argv[3], sys.argv[4])
+        sys.exit(0)
+
+    from vector_store import VectorStore
+
+    vector_store = VectorStore()
+    data = vector_store.collection.get(include=['embeddings'])
+
+    test_queries = [
+        "What are the benefits of health tourism in Turkey?",
+        "Medical tourism services",
+        "Thermal tourism in Turkey",
+        "Elderly care and geriatric tourism",
+        "Cost advantages of treatment in Turkey"
+    ]
+    query_embeddings = vector_store.embedding_model.encode(test_queries)
+
+    configs = [
+        {'dtype': 'float16'},
+        {'dtype': 'int8'},
+        {'dtype': 'int8', 'pca_dim': 128},
+    ]
+
+    # Each config is built in a temporary directory, then measured in a
+    # fresh process; the served collection's files are left alone
+    measured = {'chroma': measure_serving_memory(collection_name=vector_store.collection_name)}
+    with tempfile.TemporaryDirectory() as tmp:
+        for i, config in enumerate(configs):
+            directory = report_index_files(os.path.join(tmp, str(i)), data['ids'],
+                                           data['embeddings'], config)
+            measured[i] = measure_serving_memory(config, vector_store.collection_name, directory)
+
+    rows = compression_report(data['ids'], data['embeddings'], query_embeddings,
+                              configs=configs, measured_bytes=measured)
+    print_compression_report(rows)
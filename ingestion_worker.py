@@ -0,0 +1,251 @@
+import threading
+import time
+from typing import Dict, List
+
+from pdf_processor import PDFProcessor
+from vector_store import (VectorStore, delete_generation, get_active_generation,
+                          list_generations, new_generation_name, set_active_generation)
+
+
+class IngestionWorker:
+    """
+    Background worker that rebuilds the vector index when PDFs change
+    and hot-swaps the new generation into a running chatbot
+    """
+
+    def __init__(self, chatbot, pdf_directory: str = "data",
+                 poll_interval: float = 30.0, batch_size: int = 32,
+                 batch_pause: float = 0.05, build_duty_cycle: float = 0.5,
+                 keep_generations: int = 2):
+        """
+        Initialize ingestion worker
+
+        Args:
+            chatbot: RAGChatbot whose vector store is swapped on rebuild
+            pdf_directory: Directory watched for PDF files
+            poll_interval: Seconds between checks of the directory
+            batch_size: Chunks embedded per batch while building
+            batch_pause: Minimum seconds to yield between batches
+            build_duty_cycle: Largest share of wall time spent embedding
+                while building; the pause after each batch grows with
+                the time the batch took
+            keep_generations: Generations kept on disk, including the active one
+        """
+        self.chatbot = chatbot
+        self.pdf_directory = pdf_directory
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.batch_pause = batch_pause
+        self.build_duty_cycle = min(max(build_duty_cycle, 0.05), 1.0)
+        self.keep_generations = max(keep_generations, 2)
+
+        self.persist_directory = chatbot.vector_store.persist_directory
+        self.generations = [chatbot.vector_store.collection_name]
+        self.is_building = False
+        self.last_error = None
+
+        self._stop_event = threading.Event()
+        self._thread = None
+
+        # Record what the current index was built from
+        active = get_active_generation(self.persist_directory)
+        if active:
+            self._indexed_files = active['files']
+        elif chatbot.vector_store.collection.count() > 0:
+            # Existing database without a manifest: trust it as up to date
+            self._indexed_files = self.snapshot()
+            set_active_generation(self.generations[0], self._indexed_files,
+                                  self.persist_directory)
+        else:
+            self._indexed_files = None
+
+        # Generations from earlier runs are not served by anyone any more
+        self.prune_generations()
+
+    def snapshot(self) -> Dict[str, List[float]]:
+        """
+        Get a manifest of the PDF files in the watched directory
+
+        Returns:
+            Dictionary mapping file name to [modification time, size]
+        """
+        return PDFProcessor(pdf_directory=self.pdf_directory).get_manifest()
+
+    def prune_generations(self) -> None:
+        """
+        Delete index generations left behind by earlier processes
+        """
+        keep = {self.generations[-1]}
+        active = get_active_generation(self.persist_directory)
+        if active:
+            keep.add(active['collection'])
+
+        client = self.chatbot.vector_store.client
+        for name in list_generations(client):
+            if name in keep:
+                continue
+            try:
+                delete_generation(client, name, self.persist_directory)
+                print(f"Ingestion worker: removed stale generation '{name}'")
+            except Exception as e:
+                print(f"Ingestion worker: could not remove '{name}': {e}")
+
+    def start(self) -> None:
+        """
+        Start watching the directory in a daemon thread
+        """
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="ingestion-worker", daemon=True)
+        self._thread.start()
+        print("✓ Ingestion worker started")
+
+    def stop(self, timeout: float = None) -> None:
+        """
+        Stop the worker thread
+        """
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def check_once(self) -> bool:
+        """
+        Rebuild and swap the index if the PDF files changed
+
+        Returns:
+            True if a new generation was swapped in
+        """
+        files = self.snapshot()
+
+        # Pick up a generation built by another process (python vector_store.py)
+        active = get_active_generation(self.persist_directory)
+        if (active and active['collection'] != self.generations[-1]
+                and active['files'] == files):
+            self._swap(active['collection'], files)
+            return True
+
+        if files == self._indexed_files:
+            return False
+        if not files:
+            print("Ingestion worker: no PDF files found, keeping current index")
+            return False
+
+        self.is_building = True
+        try:
+            collection_name = self.build_generation()
+        finally:
+            self.is_building = False
+
+        if collection_name is None:
+            return False
+
+        self._swap(collection_name, files)
+        return True
+
+    def build_generation(self) -> str:
+        """
+        Build a new index generation next to the one being served
+
+        Embedding runs in this process on the model that queries use, so
+        a query that arrives during a batch waits for CPU with it. The
+        batch size bounds that extra delay to one batch, and the pause
+        after each batch keeps building to build_duty_cycle of wall time.
+        A lower duty cycle or smaller batches help queries and make
+        rebuilds take longer.
+
+        A build that fails or is stopped deletes its partial generation.
+
+        Returns:
+            Name of the new collection, or None if nothing was indexed
+        """
+        collection_name = new_generation_name()
+        print(f"\nIngestion worker: building generation '{collection_name}'...")
+        start_time = time.time()
+
+        processor = PDFProcessor(pdf_directory=self.pdf_directory)
+        chunks = processor.process_all_pdfs()
+        if not chunks:
+            print("Ingestion worker: no chunks created, keeping current index")
+            return None
+
+        # Reuse the loaded embedding model instead of loading a second copy.
+        # With compression on, add_documents also writes the exact vector
+        # file, so the swap below never has to read Chroma's vector index.
+        current = self.chatbot.vector_store
+        vector_store = VectorStore(collection_name=collection_name,
+                                   persist_directory=self.persist_directory,
+                                   embedding_model=current.embedding_model,
+                                   compression=current.compression,
+                                   pca_dim=current.pca_dim)
+
+        try:
+            for i in range(0, len(chunks), self.batch_size):
+                if self._stop_event.is_set():
+                    delete_generation(vector_store.client, collection_name, self.persist_directory)
+                    return None
+                batch_start = time.perf_counter()
+                vector_store.add_documents(chunks[i:i + self.batch_size])
+                batch_seconds = time.perf_counter() - batch_start
+                pause = batch_seconds * (1 - self.build_duty_cycle) / self.build_duty_cycle
+                self._stop_event.wait(max(pause, self.batch_pause))
+        except Exception:
+            # Do not leave a partial generation behind for every retry
+            try:
+                delete_generation(vector_store.client, collection_name, self.persist_directory)
+            except Exception as e:
+                print(f"Ingestion worker: could not remove '{collection_name}': {e}")
+            raise
+
+        print(f"Ingestion worker: built {len(chunks)} chunks "
+              f"({time.time() - start_time:.2f} seconds)")
+        return collection_name
+
+    def _swap(self, collection_name: str, files: Dict) -> None:
+        # Serve the new generation with the same compression settings;
+        # the compressed index is built here, before the swap
+        current = self.chatbot.vector_store
+        new_store = VectorStore(collection_name=collection_name,
+                                persist_directory=self.persist_directory,
+                                embedding_model=current.embedding_model,
+                                compression=current.compression,
+                                pca_dim=current.pca_dim,
+                                rescore_factor=current.rescore_factor)
+
+        # Persist the pointer first so a restart serves the same generation
+        set_active_generation(collection_name, files, self.persist_directory)
+        self.chatbot.swap_vector_store(new_store)
+        self._indexed_files = files
+        self.generations.append(collection_name)
+        print(f"✓ Ingestion worker: now serving '{collection_name}'")
+
+        # Queries already running hold a reference to the previous store,
+        # so it is kept; only older generations are dropped.
+        while len(self.generations) > self.keep_generations:
+            old_name = self.generations.pop(0)
+            try:
+                delete_generation(new_store.client, old_name, self.persist_directory)
+                print(f"Ingestion worker: removed old generation '{old_name}'")
+            except Exception as e:
+                print(f"Ingestion worker: could not remove '{old_name}': {e}")
+
+    def _run(self) -> None:
+        while not self._stop_event.is_set():
+            try:
+                self.check_once()
+                self.last_error = None
+            except Exception as e:
+                self.last_error = e
+                print(f"Ingestion worker error: {e}")
+            self._stop_event.wait(self.poll_interval)
+
+
+# Main execution
+if __name__ == "__main__":
+    from rag_chatbot import RAGChatbot
+
+    worker = IngestionWorker(RAGChatbot())
+    if worker.check_once():
+        print("✓ Index rebuilt from the current PDF files")
+    else:
+        print("✓ Index is up to date")
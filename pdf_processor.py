@@ -37,6 +37,21 @@ class PDFProcessor:
                 pdf_files.append(os.path.join(self.pdf_directory, file))
         return pdf_files
 
+    def get_manifest(self) -> Dict[str, List[float]]:
+        """
+        Get the modification time and size of every PDF file
+
+        Returns:
+            Dictionary mapping file name to [modification time, size]
+        """
+        manifest = {}
+        if not os.path.isdir(self.pdf_directory):
+            return manifest
+        for pdf_path in self.get_pdf_files():
+            stat = os.stat(pdf_path)
+            manifest[os.path.basename(pdf_path)] = [stat.st_mtime, stat.st_size]
+        return manifest
+
     def extract_text_from_pdf(self, pdf_path: str) -> str:
         """
         Extract text from a single PDF file
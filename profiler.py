@@ -0,0 +1,443 @@
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import nullcontext
+from functools import wraps
+from typing import Callable, List, Optional
+
+# Profiling is off unless RAG_PROFILE is set (or enable() is called)
+_enabled = os.getenv("RAG_PROFILE", "").lower() in ("1", "true", "yes")
+_output_dir = os.getenv("RAG_PROFILE_DIR", "profiles")
+_local = threading.local()
+_NULL_STAGE = nullcontext()
+
+# tracemalloc and its peak counter are process-wide, so only one session
+# runs at a time; profiled calls that overlap it run unprofiled
+_session_lock = threading.Lock()
+_tracemalloc_lock = threading.Lock()
+_tracemalloc_users = 0
+_tracemalloc_owned = False
+
+
+def _acquire_tracemalloc() -> None:
+    # Start tracing on first use unless someone else already traces
+    global _tracemalloc_users, _tracemalloc_owned
+    with _tracemalloc_lock:
+        if _tracemalloc_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _tracemalloc_owned = True
+        _tracemalloc_users += 1
+
+
+def _release_tracemalloc() -> None:
+    # Stop tracing only when the last user is done and we started it
+    global _tracemalloc_users, _tracemalloc_owned
+    with _tracemalloc_lock:
+        _tracemalloc_users -= 1
+        if _tracemalloc_users == 0 and _tracemalloc_owned:
+            tracemalloc.stop()
+            _tracemalloc_owned = False
+
+
+def enable(output_dir: Optional[str] = None) -> None:
+    """
+    Turn profiling mode on
+
+    Args:
+        output_dir: Directory for flamegraph and allocation reports
+    """
+    global _enabled, _output_dir
+    _enabled = True
+    if output_dir:
+        _output_dir = output_dir
+
+
+def disable() -> None:
+    """
+    Turn profiling mode off
+    """
+    global _enabled
+    _enabled = False
+
+
+def is_enabled() -> bool:
+    """
+    Whether profiling mode is on
+    """
+    return _enabled
+
+
+def _current_session() -> Optional["ProfileSession"]:
+    # A session closed from another thread may still be referenced here
+    session = getattr(_local, 'session', None)
+    if session is not None and not session.running:
+        _local.session = session = None
+    return session
+
+
+def stage(name: str):
+    """
+    Mark a pipeline stage (embedding, search, prompt, generation, ...)
+
+    Returns a shared no-op context manager unless a profiling session is
+    running on the current thread.
+
+    Args:
+        name: Stage name used in the reports
+    """
+    session = _current_session()
+    if session is None:
+        return _NULL_STAGE
+    return session.stage(name)
+
+
+def profiled(name: str, stream_key: Optional[str] = None) -> Callable:
+    """
+    Decorator that profiles every call of a function when profiling is on
+
+    Only one call is profiled at a time; calls that overlap it run
+    unprofiled rather than wait.
+
+    Args:
+        name: Name of the profiled operation, used for report file names
+        stream_key: Key of a lazy answer stream in the returned dictionary;
+            the session then stays open until that stream is consumed and
+            records its consumption as the 'generate' stage
+    """
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            # Fast path: one global check when profiling is off, and no
+            # nested sessions when a profiled call runs inside another
+            if not _enabled or _current_session() is not None:
+                return fn(*args, **kwargs)
+
+            session = ProfileSession(name, _output_dir)
+            if not session.start(blocking=False):
+                return fn(*args, **kwargs)
+
+            try:
+                result = fn(*args, **kwargs)
+            except BaseException:
+                session.stop()
+                raise
+
+            if stream_key is not None and result.get(stream_key) is not None:
+                result[stream_key] = _ProfiledStream(session, result[stream_key], "generate")
+            else:
+                session.stop()
+            return result
+        return wrapper
+    return decorator
+
+
+def follow_stream(fn: Callable) -> Callable:
+    """
+    Sample the thread that later runs a generator function as part of the
+    profiling session running now on the current thread
+
+    Used for streams produced on a background thread, so their stacks
+    appear in the flamegraph next to the consumer waiting for them.
+
+    Args:
+        fn: Generator function
+
+    Returns:
+        fn itself when no session is running, otherwise a wrapped generator
+        function
+    """
+    session = _current_session()
+    if session is None:
+        return fn
+
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        thread_id = threading.get_ident()
+        session.add_thread(thread_id)
+        try:
+            yield from fn(*args, **kwargs)
+        finally:
+            session.remove_thread(thread_id)
+    return wrapper
+
+
+class _ProfiledStream:
+    """
+    Iterator that keeps a profiling session open while a stream is consumed
+    """
+
+    def __init__(self, session: "ProfileSession", stream, stage_name: str):
+        self._session = session
+        self._stream = iter(stream)
+        self._stage = session.stage(stage_name)
+        self._started = False
+        self._finished = False
+        session.detach()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._finished:
+            raise StopIteration
+        if not self._started:
+            # The stream may be consumed on another thread than the call
+            self._started = True
+            self._session.attach()
+            self._stage.__enter__()
+        try:
+            return next(self._stream)
+        except BaseException:
+            self.close()
+            raise
+
+    def close(self) -> None:
+        """
+        End the stage and the session, writing the reports
+        """
+        if self._finished:
+            return
+        self._finished = True
+        # Release the wrapped stream now rather than when it is collected
+        close = getattr(self._stream, 'close', None)
+        if close is not None:
+            close()
+        if self._started:
+            self._stage.__exit__(None, None, None)
+        self._session.stop()
+
+    def __del__(self):
+        self.close()
+
+
+class _Stage:
+    """
+    Context manager timing one stage and diffing its allocations
+    """
+
+    def __init__(self, session: "ProfileSession", name: str):
+        self.session = session
+        self.name = name
+
+    def __enter__(self):
+        session = self.session
+        self.previous_path = session.stage_path
+
+        # Keep the profiler's own snapshot work out of the CPU samples
+        session.paused = True
+        self.snapshot = tracemalloc.take_snapshot()
+        session.paused = False
+
+        session.stage_path = self.previous_path + (self.name,)
+        tracemalloc.reset_peak()
+        self.start_time = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        session = self.session
+        elapsed = time.perf_counter() - self.start_time
+        _, peak = tracemalloc.get_traced_memory()
+
+        session.paused = True
+        snapshot = tracemalloc.take_snapshot()
+        session.paused = False
+        session.stage_path = self.previous_path
+
+        # Snapshots are diffed when the reports are written, off the hot path
+        session.stages.append({
+            'name': ";".join(self.previous_path + (self.name,)),
+            'seconds': elapsed,
+            'peak_bytes': peak,
+            'snapshots': (self.snapshot, snapshot)
+        })
+        return False
+
+
+class ProfileSession:
+    """
+    Sampled CPU stacks and tracemalloc snapshots for one profiled call
+    """
+
+    def __init__(self, name: str, output_dir: str = "profiles",
+                 interval: float = 0.005, top_allocations: int = 10):
+        """
+        Initialize profiling session
+
+        Args:
+            name: Name of the profiled operation
+            output_dir: Directory for the reports
+            interval: Seconds between stack samples
+            top_allocations: Allocation sites reported per stage
+        """
+        self.name = name
+        self.output_dir = output_dir
+        self.interval = interval
+        self.top_allocations = top_allocations
+
+        self.stage_path = (name,)
+        self.stages = []
+        self.samples = Counter()
+        self.paused = False
+
+        self._thread_id = None
+        self._other_threads = set()
+        self._stop_event = threading.Event()
+        self._sampler = None
+        self.running = False
+
+    def stage(self, name: str) -> _Stage:
+        """
+        Context manager for a stage of this session
+        """
+        return _Stage(self, name)
+
+    def start(self, blocking: bool = True) -> bool:
+        """
+        Start tracing allocations and sampling the current thread
+
+        Args:
+            blocking: Wait for another running session to finish
+
+        Returns:
+            False if another session is running and blocking is False
+        """
+        if not _session_lock.acquire(blocking=blocking):
+            return False
+        _acquire_tracemalloc()
+        self.running = True
+
+        self.attach()
+        self._sampler = threading.Thread(target=self._sample_loop, name="profile-sampler", daemon=True)
+        self._sampler.start()
+        self.start_time = time.perf_counter()
+        return True
+
+    def attach(self) -> None:
+        """
+        Make the current thread the one being profiled
+        """
+        self._thread_id = threading.get_ident()
+        _local.session = self
+        self.paused = False
+
+    def add_thread(self, thread_id: int) -> None:
+        """
+        Also sample another thread working for this session
+        """
+        self._other_threads.add(thread_id)
+
+    def remove_thread(self, thread_id: int) -> None:
+        """
+        Stop sampling a thread added with add_thread
+        """
+        self._other_threads.discard(thread_id)
+
+    def detach(self) -> None:
+        """
+        Stop sampling the current thread until attach() is called again
+        """
+        self.paused = True
+        _local.session = None
+
+    def stop(self) -> None:
+        """
+        Stop the session, write the reports and let the next session start
+        """
+        if not self.running:
+            return
+        self.running = False
+        self.total_seconds = time.perf_counter() - self.start_time
+        self._stop_event.set()
+        self._sampler.join()
+        if getattr(_local, 'session', None) is self:
+            _local.session = None
+
+        try:
+            self.write_reports()
+        except OSError as e:
+            print(f"Profiler: could not write reports: {e}")
+        finally:
+            _release_tracemalloc()
+            _session_lock.release()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+        return False
+
+    def write_reports(self) -> List[str]:
+        """
+        Write the flamegraph and allocation reports
+
+        Returns:
+            Paths of the written files
+        """
+        os.makedirs(self.output_dir, exist_ok=True)
+        base = os.path.join(self.output_dir, f"{self.name}-{time.strftime('%Y%m%d-%H%M%S')}"
+                                             f"-{int(time.time() * 1000) % 1000:03d}")
+
+        # Collapsed stacks, usable with flamegraph.pl, speedscope or inferno
+        folded_path = base + ".folded"
+        with open(folded_path, "w", encoding="utf-8") as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+
+        summary_path = base + "-allocations.txt"
+        with open(summary_path, "w", encoding="utf-8") as f:
+            f.write(f"PROFILE: {self.name} ({self.total_seconds:.3f} s, "
+                    f"{sum(self.samples.values())} samples)\n")
+            f.write("=" * 50 + "\n")
+            for stage_info in self.stages:
+                f.write(f"\nStage: {stage_info['name']}\n")
+                f.write(f"  Time: {stage_info['seconds']:.3f} s\n")
+                f.write(f"  Peak traced memory: {stage_info['peak_bytes'] / 1024:.1f} KB\n")
+                f.write("  Top allocations:\n")
+                for stat in self.top_allocation_stats(*stage_info['snapshots']):
+                    f.write(f"    {stat}\n")
+
+        print(f"✓ Profile written: {folded_path}, {summary_path}")
+        return [folded_path, summary_path]
+
+    def top_allocation_stats(self, before: tracemalloc.Snapshot,
+                             after: tracemalloc.Snapshot) -> List[tracemalloc.StatisticDiff]:
+        """
+        Source lines that allocated the most memory between two snapshots
+
+        Args:
+            before: Snapshot taken when the stage started
+            after: Snapshot taken when the stage ended
+
+        Returns:
+            Largest positive allocation differences, excluding the profiler itself
+        """
+        ignored = (tracemalloc.__file__, __file__, threading.__file__)
+        stats = [stat for stat in after.compare_to(before, 'lineno')
+                 if stat.size_diff > 0 and stat.traceback[0].filename not in ignored]
+        return stats[:self.top_allocations]
+
+    def _sample_loop(self) -> None:
+        while not self._stop_event.wait(self.interval):
+            if self.paused:
+                continue
+            frames = sys._current_frames()
+            for thread_id in [self._thread_id, *self._other_threads]:
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    self._record(frame)
+
+    def _record(self, frame) -> None:
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)})")
+            frame = frame.f_back
+        stack.reverse()
+
+        # Stage names form the root of each stack so stages group together
+        self.samples[";".join(self.stage_path + tuple(stack))] += 1
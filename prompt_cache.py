@@ -0,0 +1,108 @@
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+# Stable prompt prefix: identical for every request, sent as the model's
+# system instruction instead of inside each prompt. It is still billed as
+# input on every request; it is kept separate so the per-request text stays
+# small to build and the prefix stays byte-identical across requests.
+SYSTEM_INSTRUCTION = """You are an expert assistant on Turkish Health Tourism.
+Use the context documents provided with each question to answer the user's question accurately and concisely.
+
+Instructions:
+- Provide a concise answer (maximum 150 words)
+- Use bullet points for lists when appropriate
+- Focus on the most important information
+- If the context doesn't contain enough information, say so briefly
+- Be professional and helpful
+- Cite the document sources at the end"""
+
+
+class ContextBlockCache:
+    """
+    Small LRU cache of formatted context blocks keyed by index generation
+    and retrieved chunk ids
+
+    Formatting a context block is a string join, so this saves little; it
+    exists because context reuse was asked for, and is kept minimal.
+    Chunk ids are only unique within one index generation, so the
+    generation is part of the key.
+    """
+
+    def __init__(self, max_entries: int = 256):
+        """
+        Initialize context block cache
+
+        Args:
+            max_entries: Maximum number of cached context blocks
+        """
+        self.max_entries = max_entries
+        self._blocks = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, chunk_ids: Optional[List[str]], context_docs: List[str],
+            generation: Optional[str] = None) -> str:
+        """
+        Get the formatted context block for a set of retrieved chunks
+
+        Args:
+            chunk_ids: Ids of the retrieved chunks, None disables caching
+            context_docs: Retrieved documents, in the same order as chunk_ids
+            generation: Collection name of the index generation the chunks
+                came from
+
+        Returns:
+            Context documents formatted for the prompt
+        """
+        if chunk_ids is None:
+            return format_context(context_docs)
+
+        key = (generation, tuple(chunk_ids))
+        with self._lock:
+            block = self._blocks.get(key)
+            if block is None:
+                block = format_context(context_docs)
+                self._blocks[key] = block
+                if len(self._blocks) > self.max_entries:
+                    self._blocks.popitem(last=False)
+            else:
+                self._blocks.move_to_end(key)
+            return block
+
+    def clear(self) -> None:
+        """
+        Drop all cached blocks, e.g. after switching to a new index generation
+        """
+        with self._lock:
+            self._blocks.clear()
+
+
+def format_context(context_docs: List[str]) -> str:
+    """
+    Combine context documents into one numbered block
+    """
+    return "\n\n".join([f"Document {i + 1}:\n{doc}"
+                        for i, doc in enumerate(context_docs)])
+
+
+def create_model(genai, model_name: str, generation_config: Dict):
+    """
+    Create a Gemini model with the fixed instructions as system instruction
+
+    Gemini's explicit context caching is not used: its minimum cacheable
+    size is far larger than these instructions, so a cache could not be
+    created for them.
+
+    Args:
+        genai: The google.generativeai module
+        model_name: Gemini model name
+        generation_config: Generation settings
+
+    Returns:
+        Gemini generative model
+    """
+    return genai.GenerativeModel(
+        model_name,
+        generation_config=generation_config,
+        system_instruction=SYSTEM_INSTRUCTION
+    )
@@ -1,11 +1,34 @@
 import os
+import threading
 from dotenv import load_dotenv
 import google.generativeai as genai
 from vector_store import VectorStore
+from session_store import SessionStore
+from single_flight import SingleFlight, normalize_query
+from prompt_cache import ContextBlockCache, create_model
+import profiler
 
 # Load environment variables
 load_dotenv()
 
+# Pronouns that usually refer back to something earlier in the conversation
+REFERRING_WORDS = {
+    'it', 'its', 'they', 'them', 'their', 'this', 'that', 'these', 'those',
+    'he', 'she', 'his', 'her'
+}
+
+# Openings of elliptical follow-ups such as "What about Antalya?"
+FOLLOW_UP_OPENINGS = ('what about ', 'how about ', 'and ', 'also ')
+
+# Words that carry no topic of their own
+STOP_WORDS = {
+    'a', 'an', 'the', 'is', 'are', 'was', 'were', 'be', 'do', 'does', 'did',
+    'can', 'could', 'should', 'would', 'will', 'i', 'you', 'we', 'me', 'my',
+    'what', 'which', 'who', 'how', 'why', 'when', 'where', 'much', 'many',
+    'of', 'to', 'in', 'on', 'for', 'with', 'about', 'and', 'or', 'there',
+    'more', 'tell', 'explain', 'please', 'any', 'some', 'so', 'than', 'usually'
+}
+
 
 class RAGChatbot:
     """
@@ -31,96 +54,312 @@ class RAGChatbot:
             "max_output_tokens": 300,  # Limit output length
         }
 
-        self.model = genai.GenerativeModel(
-            'models/gemini-2.0-flash',
-            generation_config=generation_config
-        )
+        # The fixed instructions are the system instruction, so each request
+        # only sends context and question
+        self.model = create_model(genai, 'models/gemini-2.0-flash', generation_config)
+        self.context_cache = ContextBlockCache()
 
         print("✓ Gemini model initialized")
 
         # Initialize vector store
-        self.vector_store = VectorStore()
+        # Optional compressed vector index, e.g. VECTOR_COMPRESSION=int8
+        pca_dim = os.getenv("VECTOR_PCA_DIM")
+        self.vector_store = VectorStore(
+            compression=os.getenv("VECTOR_COMPRESSION") or None,
+            pca_dim=int(pca_dim) if pca_dim else None
+        )
+        self._swap_lock = threading.Lock()
         print("✓ Vector store loaded")
 
-    def create_prompt(self, query: str, context_docs: list) -> str:
+        # Coalesce identical concurrent searches and LLM calls
+        self.single_flight = SingleFlight()
+
+    def condense_query(self, query: str, history: dict = None) -> str:
+        """
+        Rewrite a follow-up question into a standalone search query
+
+        Args:
+            query: User's question
+            history: Conversation history from the session store
+
+        Returns:
+            Query to use for retrieval
+        """
+        if not history:
+            return query
+
+        previous_questions = [message['content'] for message in history.get('messages', [])
+                              if message['role'] == 'user']
+        if not previous_questions:
+            return query
+
+        if not self.is_follow_up(query):
+            return query
+
+        return f"{previous_questions[-1]} {query}"
+
+    def is_follow_up(self, query: str) -> bool:
         """
-        Create a prompt for the LLM with context
+        Check whether a question depends on the earlier conversation
+
+        A question is a follow-up when it starts like an elliptical
+        follow-up ("What about Antalya?"), or when it refers back with a
+        pronoun and names at most two topic words of its own
+        ("How much does it cost?").
+
+        Args:
+            query: User's question
+
+        Returns:
+            True if the question should be condensed with the history
+        """
+        normalized = " ".join(query.lower().split())
+        if normalized.startswith(FOLLOW_UP_OPENINGS):
+            return True
+
+        words = [word.strip("?.,!;:'\"") for word in normalized.split()]
+        if not any(word in REFERRING_WORDS for word in words):
+            return False
+
+        topic_words = [word for word in words
+                       if word and word not in REFERRING_WORDS and word not in STOP_WORDS]
+        return len(topic_words) <= 2
+
+    def format_history(self, history: dict = None) -> str:
+        """
+        Format conversation history for the prompt
+
+        Args:
+            history: Conversation history from the session store
+
+        Returns:
+            History as plain text, empty if there is none
+        """
+        if not history:
+            return ""
+
+        lines = []
+        if history.get('summary'):
+            lines.append(f"Earlier topics: {history['summary']}")
+        for message in history.get('messages', []):
+            role = "User" if message['role'] == 'user' else "Assistant"
+            lines.append(f"{role}: {message['content']}")
+        return "\n".join(lines)
+
+    def create_prompt(self, query: str, context_docs: list, history: dict = None,
+                      chunk_ids: list = None, generation: str = None) -> str:
+        """
+        Create the variable part of the prompt (context and question)
+
+        The fixed instructions are sent once as the model's system
+        instruction, see prompt_cache.SYSTEM_INSTRUCTION.
 
         Args:
             query: User's question
             context_docs: Retrieved documents from vector store
+            history: Conversation history from the session store
+            chunk_ids: Ids of the retrieved documents, used to reuse
+                the formatted context block
+            generation: Collection the documents were retrieved from
 
         Returns:
             Formatted prompt string
         """
         # Combine context documents
-        context = "\n\n".join([f"Document {i + 1}:\n{doc}"
-                               for i, doc in enumerate(context_docs)])
+        context = self.context_cache.get(chunk_ids, context_docs, generation)
 
-        prompt = f"""You are an expert assistant on Turkish Health Tourism. 
-    Use the following context documents to answer the user's question accurately and concisely.
+        conversation = self.format_history(history)
+        if conversation:
+            conversation = f"""
+Conversation So Far:
+{conversation}
+"""
 
-    Context Documents:
-    {context}
+        prompt = f"""Context Documents:
+{context}
+{conversation}
+User Question: {query}
 
-    User Question: {query}
+Answer:"""
 
-    Instructions:
-    - Provide a concise answer (maximum 150 words)
-    - Use bullet points for lists when appropriate
-    - Focus on the most important information
-    - If the context doesn't contain enough information, say so briefly
-    - Be professional and helpful
-    - Cite the document sources at the end
+        return prompt
 
-    Answer:"""
+    def generate(self, prompt: str, stream: bool = False):
+        """
+        Call Gemini with the variable part of the prompt
 
-        return prompt
+        Args:
+            prompt: Prompt built by create_prompt
+            stream: Stream the response
 
-    def get_answer(self, query: str, n_results: int = 3) -> dict:
+        Returns:
+            Gemini response
         """
-        Get answer for a user query using RAG
+        return self.model.generate_content(prompt, stream=stream)
+
+    def retrieve(self, query: str, n_results: int = 3, history: dict = None) -> dict:
+        """
+        Retrieve context documents for a query
+
+        Identical concurrent searches (after normalization) share one
+        vector store lookup.
 
         Args:
             query: User's question
             n_results: Number of context documents to retrieve
+            history: Recent conversation history used to resolve follow-ups
 
         Returns:
-            Dictionary containing answer and sources
+            Dictionary containing the search query and retrieved documents
         """
-        print(f"\nProcessing query: '{query}'")
-        print("-" * 50)
+        # Pin the index generation so a hot swap cannot change it mid-query
+        vector_store = self.vector_store
+
+        # Resolve follow-up questions before searching
+        search_query = self.condense_query(query, history)
+        if search_query != query:
+            print(f"Condensed follow-up to: '{search_query}'")
 
-        # Step 1: Retrieve relevant documents
         print("Searching vector database...")
-        search_results = self.vector_store.search(query, n_results=n_results)
+        key = ('search', vector_store.collection_name, normalize_query(search_query), n_results)
+        search_results = self.single_flight.do(
+            key, lambda: vector_store.search(search_query, n_results=n_results))
 
         context_docs = search_results['documents'][0]
         metadatas = search_results['metadatas'][0]
 
         print(f"✓ Found {len(context_docs)} relevant documents")
 
+        return {
+            'search_query': search_query,
+            'context_docs': context_docs,
+            'ids': search_results['ids'][0],
+            'collection': vector_store.collection_name,
+            # Extract unique sources
+            'sources': list(set([meta['source'] for meta in metadatas]))
+        }
+
+    def _generation_key(self, query: str, retrieval: dict, history: dict = None) -> tuple:
+        # Same normalized question, same context and same conversation
+        # produce the same prompt, so they can share one LLM call. Chunk ids
+        # are only unique within one index generation.
+        return (normalize_query(query), retrieval['collection'], tuple(retrieval['ids']),
+                self.format_history(history))
+
+    @profiler.profiled("get_answer")
+    def get_answer(self, query: str, n_results: int = 3, history: dict = None) -> dict:
+        """
+        Get answer for a user query using RAG
+
+        Args:
+            query: User's question
+            n_results: Number of context documents to retrieve
+            history: Recent conversation history used to resolve follow-ups
+
+        Returns:
+            Dictionary containing answer and sources
+        """
+        print(f"\nProcessing query: '{query}'")
+        print("-" * 50)
+
+        # Step 1: Retrieve relevant documents
+        retrieval = self.retrieve(query, n_results=n_results, history=history)
+
         # Step 2: Create prompt with context
-        prompt = self.create_prompt(query, context_docs)
+        with profiler.stage("prompt"):
+            prompt = self.create_prompt(query, retrieval['context_docs'], history,
+                                        chunk_ids=retrieval['ids'],
+                                        generation=retrieval['collection'])
 
         # Step 3: Generate answer using Gemini
         print("Generating answer with Gemini...")
-        response = self.model.generate_content(prompt)
-
-        answer = response.text
-
-        # Extract unique sources
-        sources = list(set([meta['source'] for meta in metadatas]))
+        key = ('generate',) + self._generation_key(query, retrieval, history)
+        with profiler.stage("generate"):
+            answer = self.single_flight.do(key, lambda: self.generate(prompt).text)
 
         print("✓ Answer generated")
 
         return {
             'query': query,
+            'search_query': retrieval['search_query'],
             'answer': answer,
-            'sources': sources,
-            'context_docs': context_docs
+            'sources': retrieval['sources'],
+            'context_docs': retrieval['context_docs']
+        }
+
+    @profiler.profiled("stream_answer", stream_key='answer_stream')
+    def stream_answer(self, query: str, n_results: int = 3, history: dict = None) -> dict:
+        """
+        Get answer for a user query using RAG, streaming the generated text
+
+        Identical concurrent questions share one Gemini stream; late joiners
+        receive the tokens produced so far and then follow the live stream.
+
+        Args:
+            query: User's question
+            n_results: Number of context documents to retrieve
+            history: Recent conversation history used to resolve follow-ups
+
+        Returns:
+            Dictionary containing an answer text iterator and sources
+        """
+        print(f"\nProcessing query (streaming): '{query}'")
+        print("-" * 50)
+
+        retrieval = self.retrieve(query, n_results=n_results, history=history)
+        with profiler.stage("prompt"):
+            prompt = self.create_prompt(query, retrieval['context_docs'], history,
+                                        chunk_ids=retrieval['ids'],
+                                        generation=retrieval['collection'])
+
+        # The answer is generated while the caller reads the stream, so in
+        # profiling mode its 'generate' stage covers that consumption. The
+        # Gemini call runs on the single-flight producer thread, which is
+        # sampled too.
+        @profiler.follow_stream
+        def stream_chunks():
+            for chunk in self.generate(prompt, stream=True):
+                yield chunk.text
+
+        print("Streaming answer from Gemini...")
+        key = ('stream',) + self._generation_key(query, retrieval, history)
+
+        return {
+            'query': query,
+            'search_query': retrieval['search_query'],
+            'answer_stream': self.single_flight.do_stream(key, stream_chunks),
+            'sources': retrieval['sources'],
+            'context_docs': retrieval['context_docs']
         }
 
+    def swap_vector_store(self, vector_store: VectorStore) -> VectorStore:
+        """
+        Atomically replace the vector store used for new queries
+
+        Queries already running keep the store they started with.
+
+        Args:
+            vector_store: Vector store serving the new index generation
+
+        Returns:
+            The previous vector store
+        """
+        with self._swap_lock:
+            old_store = self.vector_store
+            self.vector_store = vector_store
+        # Blocks of the old generation will not be asked for again
+        self.context_cache.clear()
+        return old_store
+
+    def get_dedup_stats(self) -> dict:
+        """
+        Get single-flight counters for retrieval and LLM calls
+
+        Returns:
+            Dictionary with requests, executions and saved call counts
+        """
+        return self.single_flight.get_stats()
+
     def chat(self):
         """
         Interactive chat loop
@@ -132,6 +371,9 @@ class RAGChatbot:
         print("Type 'exit' to quit")
         print("=" * 50 + "\n")
 
+        session_store = SessionStore()
+        session_id = session_store.new_session_id()
+
         while True:
             # Get user input
             user_query = input("You: ").strip()
@@ -144,7 +386,10 @@ class RAGChatbot:
                 continue
 
             # Get answer
-            result = self.get_answer(user_query)
+            history = session_store.get_history(session_id)
+            result = self.get_answer(user_query, history=history)
+            session_store.add_message(session_id, "user", user_query)
+            session_store.add_message(session_id, "assistant", result['answer'], result['sources'])
 
             # Display answer
             print("\n" + "=" * 50)
@@ -0,0 +1,204 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import List, Dict, Optional
+
+
+class ChatSession:
+    """
+    Bounded conversation history for a single user session
+    """
+
+    def __init__(self, session_id: str):
+        """
+        Initialize chat session
+
+        Args:
+            session_id: Unique identifier of the session
+        """
+        self.session_id = session_id
+        self.messages = []  # Recent messages kept verbatim
+        self.summary = ""  # Condensed form of evicted turns
+        self.last_access = time.time()
+
+    def size_chars(self) -> int:
+        """
+        Approximate memory footprint of the session in characters
+        """
+        size = len(self.summary)
+        for message in self.messages:
+            size += len(message['content'])
+            size += sum(len(source) for source in message.get('sources', []))
+        return size
+
+
+class SessionStore:
+    """
+    Thread-safe store of chat sessions with per-session and global memory caps
+    """
+
+    def __init__(self,
+                 max_messages_per_session: int = 20,
+                 max_chars_per_session: int = 20000,
+                 max_total_chars: int = 5000000,
+                 max_sessions: int = 1000,
+                 max_summary_chars: int = 1000):
+        """
+        Initialize session store
+
+        Args:
+            max_messages_per_session: Messages kept verbatim per session
+            max_chars_per_session: Character budget for a single session
+            max_total_chars: Character budget across all sessions
+            max_sessions: Maximum number of live sessions
+            max_summary_chars: Maximum length of a session's summary, must
+                be smaller than max_chars_per_session
+        """
+        if max_summary_chars >= max_chars_per_session:
+            raise ValueError("max_summary_chars must be smaller than max_chars_per_session")
+
+        self.max_messages_per_session = max_messages_per_session
+        self.max_chars_per_session = max_chars_per_session
+        self.max_total_chars = max_total_chars
+        self.max_sessions = max_sessions
+        self.max_summary_chars = max_summary_chars
+
+        self._sessions = OrderedDict()  # Least recently used first
+        self._sizes = {}
+        self._total_chars = 0
+        self._lock = threading.Lock()
+
+    def new_session_id(self) -> str:
+        """
+        Generate a new unique session id
+        """
+        return uuid.uuid4().hex
+
+    def add_message(self, session_id: str, role: str, content: str,
+                    sources: Optional[List[str]] = None) -> None:
+        """
+        Append a message to a session and enforce memory caps
+
+        Content longer than the room left next to a full summary is
+        truncated, so one huge message cannot push the session over its
+        budget and evict other users' sessions.
+
+        Args:
+            session_id: Unique identifier of the session
+            role: 'user' or 'assistant'
+            content: Message text
+            sources: Source documents for assistant messages
+        """
+        max_content_chars = self.max_chars_per_session - self.max_summary_chars
+        message = {'role': role, 'content': content[:max_content_chars]}
+        if sources is not None:
+            message['sources'] = list(sources)
+
+        with self._lock:
+            session = self._touch(session_id)
+            session.messages.append(message)
+            self._compact(session)
+            self._update_size(session)
+            self._evict_sessions(keep=session_id)
+
+    def get_history(self, session_id: str, max_turns: Optional[int] = 3) -> Dict:
+        """
+        Get the conversation history of a session
+
+        Reading never creates a session, so page loads that send no
+        message do not use memory.
+
+        Args:
+            session_id: Unique identifier of the session
+            max_turns: Number of recent user/assistant turns to return,
+                None for every message still held
+
+        Returns:
+            Dictionary containing the summary and recent messages
+        """
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return {'summary': "", 'messages': []}
+            self._sessions.move_to_end(session_id)
+            session.last_access = time.time()
+
+            messages = session.messages
+            if max_turns is not None:
+                messages = messages[-2 * max_turns:]
+            return {'summary': session.summary, 'messages': list(messages)}
+
+    def clear_session(self, session_id: str) -> None:
+        """
+        Remove a session and release its memory
+        """
+        with self._lock:
+            self._remove(session_id)
+
+    def get_stats(self) -> Dict:
+        """
+        Get memory usage statistics of the store
+        """
+        with self._lock:
+            return {
+                'sessions': len(self._sessions),
+                'total_chars': self._total_chars,
+                'max_total_chars': self.max_total_chars
+            }
+
+    def _touch(self, session_id: str) -> ChatSession:
+        session = self._sessions.get(session_id)
+        if session is None:
+            session = ChatSession(session_id)
+            self._sessions[session_id] = session
+            self._sizes[session_id] = 0
+        else:
+            self._sessions.move_to_end(session_id)
+        session.last_access = time.time()
+        return session
+
+    def _compact(self, session: ChatSession) -> None:
+        # Fold the oldest messages into the summary until the session fits.
+        # The latest message is always kept verbatim.
+        while len(session.messages) > 1 and (
+                len(session.messages) > self.max_messages_per_session
+                or session.size_chars() > self.max_chars_per_session):
+            message = session.messages.pop(0)
+            if message['role'] == 'user':
+                self._summarize(session, message['content'])
+
+    def _summarize(self, session: ChatSession, question: str) -> None:
+        # Only earlier user questions are kept; answers can be recovered
+        # from the documents if the user asks again.
+        topic = " ".join(question.split())[:120]
+        if session.summary:
+            summary = f"{session.summary}; {topic}"
+        else:
+            summary = topic
+        if len(summary) > self.max_summary_chars:
+            start = len(summary) - self.max_summary_chars
+            cut_mid_topic = summary[start - 2:start] != "; "
+            summary = summary[start:]
+            if cut_mid_topic:
+                summary = summary.split("; ", 1)[-1]
+        session.summary = summary
+
+    def _update_size(self, session: ChatSession) -> None:
+        size = session.size_chars()
+        self._total_chars += size - self._sizes[session.session_id]
+        self._sizes[session.session_id] = size
+
+    def _evict_sessions(self, keep: str) -> None:
+        # Drop least recently used sessions when global caps are exceeded
+        while (len(self._sessions) > self.max_sessions
+               or self._total_chars > self.max_total_chars):
+            oldest_id = next(iter(self._sessions))
+            if oldest_id == keep:
+                break
+            self._remove(oldest_id)
+
+    def _remove(self, session_id: str) -> None:
+        if session_id in self._sessions:
+            del self._sessions[session_id]
+            self._total_chars -= self._sizes.pop(session_id)
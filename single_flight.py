@@ -0,0 +1,212 @@
+import threading
+from typing import Any, Callable, Dict, Hashable, Iterable, Iterator
+
+
+def normalize_query(query: str) -> str:
+    """
+    Normalize a query so trivially different spellings share one call
+
+    Args:
+        query: Raw user query
+
+    Returns:
+        Lowercased query with collapsed whitespace and no trailing punctuation
+    """
+    return " ".join(query.lower().split()).rstrip("?.!,;: ")
+
+
+class _Call:
+    """
+    A single in-flight call whose result is shared by all waiters
+    """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class _StreamCall:
+    """
+    A single in-flight streaming call whose chunks are replayed to all waiters
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.chunks = []
+        self.done = False
+        self.error = None
+        self.readers = 0
+
+
+class _StreamReader:
+    """
+    Iterator over a shared stream; replays produced chunks, then follows live
+    """
+
+    def __init__(self, group: "SingleFlight", call: _StreamCall):
+        self._group = group
+        self._call = call
+        self._index = 0
+        self._closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._closed:
+            raise StopIteration
+        call = self._call
+        with call.condition:
+            while self._index >= len(call.chunks) and not call.done:
+                call.condition.wait()
+            if self._index < len(call.chunks):
+                chunk = call.chunks[self._index]
+                self._index += 1
+                return chunk
+            error = call.error
+        self.close()
+        if error is not None:
+            raise error
+        raise StopIteration
+
+    def close(self) -> None:
+        """
+        Stop reading; the producer is cancelled once no reader is left
+        """
+        if not self._closed:
+            self._closed = True
+            self._group._release_reader(self._call)
+
+    def __del__(self):
+        self.close()
+
+
+class SingleFlight:
+    """
+    Coalesce identical concurrent calls into one execution
+    """
+
+    def __init__(self):
+        """
+        Initialize single-flight group
+        """
+        # Reentrant: a reader dropped by the garbage collector releases
+        # itself from __del__, which may run while this lock is held
+        self._lock = threading.RLock()
+        self._calls = {}
+        self._streams = {}
+        self._stats = {'requests': 0, 'executions': 0, 'saved': 0}
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        """
+        Run fn once for all concurrent callers with the same key
+
+        Args:
+            key: Identity of the call
+            fn: Function producing the result
+
+        Returns:
+            The result of the (possibly shared) call
+        """
+        with self._lock:
+            self._stats['requests'] += 1
+            call = self._calls.get(key)
+            is_leader = call is None
+            if is_leader:
+                call = _Call()
+                self._calls[key] = call
+                self._stats['executions'] += 1
+            else:
+                self._stats['saved'] += 1
+
+        if not is_leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+        return call.result
+
+    def do_stream(self, key: Hashable, fn: Callable[[], Iterable]) -> Iterator:
+        """
+        Stream the output of fn once for all concurrent callers with the same key
+
+        The first caller starts fn in a background thread right away, so the
+        shared call always finishes and releases its key even if no one
+        iterates. Every caller, including the first, reads the shared
+        buffer: late joiners receive the chunks produced so far, then
+        follow the live stream. When all readers close, the producer stops
+        at the next chunk.
+
+        Args:
+            key: Identity of the call
+            fn: Function returning an iterable of chunks
+
+        Returns:
+            Iterator over the chunks of the (possibly shared) stream
+        """
+        with self._lock:
+            self._stats['requests'] += 1
+            call = self._streams.get(key)
+            is_leader = call is None
+            if is_leader:
+                call = _StreamCall()
+                self._streams[key] = call
+                self._stats['executions'] += 1
+            else:
+                self._stats['saved'] += 1
+            call.readers += 1
+
+        if is_leader:
+            producer = threading.Thread(target=self._produce, args=(key, call, fn),
+                                        name="single-flight-stream", daemon=True)
+            producer.start()
+        return _StreamReader(self, call)
+
+    def get_stats(self) -> Dict[str, int]:
+        """
+        Get counters of requests, actual executions and calls saved
+        """
+        with self._lock:
+            return dict(self._stats)
+
+    def _produce(self, key: Hashable, call: _StreamCall, fn: Callable[[], Iterable]) -> None:
+        iterator = None
+        try:
+            iterator = iter(fn())
+            for chunk in iterator:
+                with call.condition:
+                    call.chunks.append(chunk)
+                    call.condition.notify_all()
+                with self._lock:
+                    if call.readers == 0:
+                        # Everyone went away: stop and let new callers start fresh
+                        self._streams.pop(key, None)
+                        break
+        except Exception as e:
+            call.error = e
+        finally:
+            with self._lock:
+                if self._streams.get(key) is call:
+                    del self._streams[key]
+            with call.condition:
+                call.done = True
+                call.condition.notify_all()
+            close = getattr(iterator, 'close', None)
+            if close is not None:
+                close()
+
+    def _release_reader(self, call: _StreamCall) -> None:
+        with self._lock:
+            call.readers -= 1
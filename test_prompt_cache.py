@@ -0,0 +1,128 @@
+import os
+from unittest import mock
+
+import pytest
+
+from prompt_cache import SYSTEM_INSTRUCTION, ContextBlockCache, create_model
+
+
+class RecordingResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class RecordingModel:
+    def __init__(self, calls, system_instruction):
+        self.calls = calls
+        self.system_instruction = system_instruction
+
+    def generate_content(self, prompt, stream=False):
+        self.calls.append({'system_instruction': self.system_instruction, 'prompt': prompt})
+        response = RecordingResponse("Recorded answer.")
+        return iter([response]) if stream else response
+
+
+class RecordingGenAI:
+    """
+    Stand-in for the google.generativeai module that records every request
+    """
+
+    def __init__(self):
+        self.calls = []
+
+    def configure(self, **kwargs):
+        pass
+
+    def GenerativeModel(self, model_name, generation_config=None, system_instruction=None):
+        return RecordingModel(self.calls, system_instruction)
+
+
+class FixedResultsStore:
+    """
+    Vector store stand-in returning preset search results
+    """
+
+    def __init__(self, collection_name="gen_a", **kwargs):
+        self.collection_name = collection_name
+        self.set_results([], [])
+
+    def set_results(self, ids, documents):
+        self.results = {'ids': [ids], 'documents': [documents],
+                        'metadatas': [[{'source': chunk_id} for chunk_id in ids]]}
+
+    def search(self, query, n_results=3):
+        return self.results
+
+
+@pytest.fixture
+def chatbot_and_calls():
+    rag_chatbot = pytest.importorskip("rag_chatbot")
+    recorder = RecordingGenAI()
+    with mock.patch.object(rag_chatbot, 'genai', recorder), \
+            mock.patch.object(rag_chatbot, 'VectorStore', FixedResultsStore), \
+            mock.patch.dict(os.environ, {'GEMINI_API_KEY': 'not-used'}):
+        yield rag_chatbot.RAGChatbot(), recorder.calls
+
+
+def test_context_block_is_reused_for_same_chunks():
+    cache = ContextBlockCache()
+    first = cache.get(["a", "b"], ["text a", "text b"], "gen_a")
+
+    assert cache.get(["a", "b"], ["ignored", "ignored"], "gen_a") is first
+    assert first == "Document 1:\ntext a\n\nDocument 2:\ntext b"
+
+
+def test_context_block_is_keyed_by_generation():
+    cache = ContextBlockCache()
+    cache.get(["a"], ["old text"], "gen_a")
+
+    assert cache.get(["a"], ["new text"], "gen_b") == "Document 1:\nnew text"
+
+
+def test_context_block_cache_evicts_least_recently_used():
+    cache = ContextBlockCache(max_entries=2)
+    cache.get(["a"], ["a1"])
+    cache.get(["b"], ["b1"])
+    cache.get(["a"], ["a2"])
+    cache.get(["c"], ["c1"])
+
+    assert cache.get(["a"], ["a3"]) == "Document 1:\na1"
+    assert cache.get(["b"], ["b2"]) == "Document 1:\nb2"
+
+
+def test_create_model_sends_instructions_as_system_instruction():
+    recorder = RecordingGenAI()
+    model = create_model(recorder, "model", {})
+    model.generate_content("prompt")
+
+    assert recorder.calls == [{'system_instruction': SYSTEM_INSTRUCTION, 'prompt': "prompt"}]
+
+
+def test_prompt_never_repeats_system_instruction(chatbot_and_calls):
+    chatbot, calls = chatbot_and_calls
+    chatbot.vector_store.set_results(["a_0", "a_1"], ["Clinics in Istanbul.", "Thermal spas."])
+
+    chatbot.get_answer("What is health tourism?")
+    "".join(chatbot.stream_answer("Why choose Turkey?")['answer_stream'])
+
+    assert len(calls) == 2
+    for call in calls:
+        assert call['system_instruction'] == SYSTEM_INSTRUCTION
+        assert SYSTEM_INSTRUCTION not in call['prompt']
+        assert "Instructions:" not in call['prompt']
+        assert "Clinics in Istanbul." in call['prompt']
+
+
+def test_new_generation_uses_rebuilt_text_for_same_chunk_ids(chatbot_and_calls):
+    chatbot, calls = chatbot_and_calls
+    chatbot.vector_store.set_results(["a_0"], ["Old clinic list."])
+    chatbot.get_answer("Which clinics are there?")
+
+    rebuilt = FixedResultsStore("gen_b")
+    rebuilt.set_results(["a_0"], ["Updated clinic list."])
+    chatbot.swap_vector_store(rebuilt)
+    chatbot.get_answer("Which clinics are there?")
+
+    assert "Old clinic list." in calls[0]['prompt']
+    assert "Updated clinic list." in calls[1]['prompt']
+    assert "Old clinic list." not in calls[1]['prompt']
@@ -0,0 +1,101 @@
+import pytest
+
+from session_store import SessionStore
+
+
+def add_turn(store, session_id, question, answer="answer"):
+    store.add_message(session_id, "user", question)
+    store.add_message(session_id, "assistant", answer, sources=["doc.pdf"])
+
+
+def test_reading_does_not_create_sessions():
+    store = SessionStore()
+
+    assert store.get_history("unknown") == {'summary': "", 'messages': []}
+    assert store.get_stats()['sessions'] == 0
+
+
+def test_old_turns_are_folded_into_summary():
+    store = SessionStore(max_messages_per_session=4)
+    for i in range(4):
+        add_turn(store, "s", f"question {i}")
+
+    history = store.get_history("s", max_turns=None)
+
+    assert [m['content'] for m in history['messages']] == \
+        ["question 2", "answer", "question 3", "answer"]
+    assert history['summary'] == "question 0; question 1"
+
+
+def test_get_history_returns_recent_turns():
+    store = SessionStore()
+    for i in range(5):
+        add_turn(store, "s", f"question {i}")
+
+    messages = store.get_history("s", max_turns=2)['messages']
+
+    assert [m['content'] for m in messages] == ["question 3", "answer", "question 4", "answer"]
+
+
+def test_summary_is_truncated_to_whole_topics():
+    store = SessionStore(max_messages_per_session=2, max_chars_per_session=1000,
+                         max_summary_chars=30)
+    for i in range(10):
+        add_turn(store, "s", f"topic number {i}")
+
+    summary = store.get_history("s")['summary']
+
+    assert len(summary) <= 30
+    assert summary.split("; ") == ["topic number 7", "topic number 8"]
+
+
+def test_huge_message_is_truncated_to_session_budget():
+    store = SessionStore(max_chars_per_session=100, max_summary_chars=20)
+    store.add_message("s", "user", "x" * 10000)
+
+    assert len(store.get_history("s")['messages'][0]['content']) == 80
+    assert store.get_stats()['total_chars'] <= 100
+
+
+def test_huge_message_does_not_evict_other_sessions():
+    store = SessionStore(max_chars_per_session=100, max_summary_chars=20, max_total_chars=1000)
+    add_turn(store, "a", "small question")
+    store.add_message("b", "user", "x" * 10000)
+
+    assert store.get_stats()['sessions'] == 2
+
+
+def test_summary_budget_must_fit_session_budget():
+    with pytest.raises(ValueError):
+        SessionStore(max_chars_per_session=100, max_summary_chars=100)
+
+
+def test_least_recently_used_session_is_evicted_first():
+    store = SessionStore(max_sessions=2)
+    add_turn(store, "a", "question a")
+    add_turn(store, "b", "question b")
+    store.get_history("a")  # "a" is now more recent than "b"
+    add_turn(store, "c", "question c")
+
+    assert store.get_history("b")['messages'] == []
+    assert store.get_history("a")['messages'] != []
+    assert store.get_stats()['sessions'] == 2
+
+
+def test_global_character_budget_evicts_oldest_sessions():
+    store = SessionStore(max_chars_per_session=200, max_summary_chars=50, max_total_chars=250)
+    for name in ("a", "b", "c"):
+        store.add_message(name, "user", name * 100)
+
+    stats = store.get_stats()
+    assert stats['sessions'] == 2
+    assert stats['total_chars'] <= 250
+    assert store.get_history("a")['messages'] == []
+
+
+def test_clear_session_releases_memory():
+    store = SessionStore()
+    add_turn(store, "s", "question")
+    store.clear_session("s")
+
+    assert store.get_stats() == {'sessions': 0, 'total_chars': 0, 'max_total_chars': 5000000}
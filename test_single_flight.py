@@ -0,0 +1,146 @@
+import gc
+import threading
+import time
+
+import pytest
+
+from single_flight import SingleFlight, normalize_query
+
+
+def slow_stream(n=5, delay=0.02, started=None, produced=None):
+    """
+    Build a stream function yielding n chunks with a delay between them
+    """
+    def fn():
+        if started is not None:
+            started.set()
+        for i in range(n):
+            time.sleep(delay)
+            if produced is not None:
+                produced.append(i)
+            yield str(i)
+    return fn
+
+
+def run_in_threads(target, count):
+    results = [None] * count
+    errors = [None] * count
+
+    def worker(i):
+        try:
+            results[i] = target()
+        except Exception as e:
+            errors[i] = e
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=5)
+        assert not thread.is_alive()
+    return results, errors
+
+
+def test_normalize_query():
+    assert normalize_query("  What is Health   Tourism?? ") == "what is health tourism"
+
+
+def test_do_coalesces_concurrent_calls():
+    group = SingleFlight()
+    calls = []
+
+    def fn():
+        calls.append(1)
+        time.sleep(0.1)
+        return 42
+
+    results, errors = run_in_threads(lambda: group.do("k", fn), 10)
+
+    assert calls == [1]
+    assert results == [42] * 10
+    assert errors == [None] * 10
+    assert group.get_stats() == {'requests': 10, 'executions': 1, 'saved': 9}
+
+
+def test_do_leader_error_reaches_all_waiters():
+    group = SingleFlight()
+
+    def fn():
+        time.sleep(0.1)
+        raise ValueError("boom")
+
+    _, errors = run_in_threads(lambda: group.do("k", fn), 5)
+
+    assert all(isinstance(error, ValueError) for error in errors)
+    # The key is released, so the next call runs again
+    assert group.do("k", lambda: "ok") == "ok"
+
+
+def test_stream_follower_joining_mid_stream_gets_everything():
+    group = SingleFlight()
+    produced = []
+    leader = group.do_stream("k", slow_stream(produced=produced))
+
+    first = next(leader)
+    while len(produced) < 3:
+        time.sleep(0.01)
+    follower = group.do_stream("k", slow_stream())
+
+    assert first + "".join(leader) == "01234"
+    assert "".join(follower) == "01234"
+    assert group.get_stats()['executions'] == 1
+
+
+def test_stream_leader_error_reaches_followers():
+    group = SingleFlight()
+
+    def fn():
+        yield "a"
+        time.sleep(0.05)
+        raise RuntimeError("stream failed")
+
+    leader = group.do_stream("k", fn)
+    follower = group.do_stream("k", fn)
+
+    for reader in (leader, follower):
+        assert next(reader) == "a"
+        with pytest.raises(RuntimeError):
+            next(reader)
+    assert "k" not in group._streams
+
+
+def test_stream_dropped_leader_does_not_block_followers():
+    group = SingleFlight()
+    started = threading.Event()
+
+    leader = group.do_stream("k", slow_stream(started=started))
+    follower = group.do_stream("k", slow_stream())
+    del leader
+    gc.collect()
+
+    # The producer runs even though the leader never iterated
+    assert started.wait(timeout=2)
+    results, errors = run_in_threads(lambda: "".join(follower), 1)
+    assert results == ["01234"]
+    assert errors == [None]
+
+
+def test_stream_abandoned_by_everyone_is_cancelled_and_released():
+    group = SingleFlight()
+    produced = []
+    leader = group.do_stream("k", slow_stream(n=50, produced=produced))
+
+    next(leader)
+    start = time.time()
+    leader.close()
+    # Closing never waits for the rest of the stream
+    assert time.time() - start < 0.05
+
+    deadline = time.time() + 2
+    while "k" in group._streams and time.time() < deadline:
+        time.sleep(0.01)
+    assert "k" not in group._streams
+    assert len(produced) < 50
+
+    # A new identical question starts a fresh stream
+    assert "".join(group.do_stream("k", slow_stream())) == "01234"
@@ -1,9 +1,82 @@
 import os
-from typing import List, Dict
+import json
+import time
+from typing import List, Dict, Optional
 import chromadb
 from chromadb.config import Settings
 from sentence_transformers import SentenceTransformer
 from pdf_processor import PDFProcessor
+from compressed_index import (CompressedIndex, append_exact_vectors, exact_ids_path,
+                              load_exact_vectors, rescore)
+import profiler
+
+DEFAULT_COLLECTION_NAME = "health_tourism_docs"
+ACTIVE_GENERATION_FILE = "active_generation.json"
+
+
+def get_active_generation(persist_directory: str = "./chroma_db") -> Optional[Dict]:
+    """
+    Read the pointer to the index generation currently in use
+
+    Args:
+        persist_directory: Chroma database directory
+
+    Returns:
+        Dictionary with the collection name and source file manifest, or None
+    """
+    path = os.path.join(persist_directory, ACTIVE_GENERATION_FILE)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def set_active_generation(collection_name: str, files: Dict,
+                          persist_directory: str = "./chroma_db") -> None:
+    """
+    Atomically point the database at a new index generation
+
+    Args:
+        collection_name: Name of the collection to serve
+        files: Manifest of the source files the collection was built from
+        persist_directory: Chroma database directory
+    """
+    os.makedirs(persist_directory, exist_ok=True)
+    path = os.path.join(persist_directory, ACTIVE_GENERATION_FILE)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({'collection': collection_name, 'files': files}, f)
+    os.replace(tmp_path, path)
+
+
+def new_generation_name() -> str:
+    """
+    Name for a new index generation collection
+    """
+    return f"{DEFAULT_COLLECTION_NAME}_gen{int(time.time() * 1000)}"
+
+
+def list_generations(client) -> List[str]:
+    """
+    Names of all index generation collections in a Chroma database
+    """
+    prefix = f"{DEFAULT_COLLECTION_NAME}_gen"
+    names = [getattr(collection, 'name', collection) for collection in client.list_collections()]
+    return sorted(name for name in names if name.startswith(prefix))
+
+
+def delete_generation(client, collection_name: str,
+                      persist_directory: str = "./chroma_db") -> None:
+    """
+    Delete an index generation and its compressed index files
+    """
+    client.delete_collection(collection_name)
+    exact_path = os.path.join(persist_directory, f"{collection_name}.exact.f32")
+    for path in (os.path.join(persist_directory, f"{collection_name}.compressed.npz"),
+                 exact_path, exact_ids_path(exact_path)):
+        if os.path.exists(path):
+            os.remove(path)
 
 
 class VectorStore:
@@ -11,22 +84,40 @@ class VectorStore:
     Create and manage vector database using Chroma
     """
 
-    def __init__(self, collection_name: str = "health_tourism_docs"):
+    def __init__(self, collection_name: Optional[str] = None,
+                 persist_directory: str = "./chroma_db",
+                 embedding_model: Optional[SentenceTransformer] = None,
+                 compression: Optional[str] = None,
+                 pca_dim: Optional[int] = None,
+                 rescore_factor: int = 4):
         """
         Initialize vector store
 
         Args:
-            collection_name: Name of the Chroma collection
+            collection_name: Name of the Chroma collection. Defaults to the
+                active index generation, or the base collection if none
+            persist_directory: Chroma database directory
+            embedding_model: Already loaded embedding model to reuse
+            compression: Serve queries from a compressed index ('float16' or 'int8')
+            pca_dim: Reduce the compressed vectors to this many dimensions
+            rescore_factor: Candidates per result re-scored with exact
+                embeddings (0 disables re-scoring)
         """
+        if collection_name is None:
+            active = get_active_generation(persist_directory)
+            collection_name = active['collection'] if active else DEFAULT_COLLECTION_NAME
         self.collection_name = collection_name
+        self.persist_directory = persist_directory
 
         # Initialize embedding model
-        print("Loading embedding model...")
-        self.embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
-        print("✓ Embedding model loaded")
+        if embedding_model is None:
+            print("Loading embedding model...")
+            embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
+            print("✓ Embedding model loaded")
+        self.embedding_model = embedding_model
 
         # Initialize Chroma client
-        self.client = chromadb.PersistentClient(path="./chroma_db")
+        self.client = chromadb.PersistentClient(path=persist_directory)
 
         # Get or create collection
         try:
@@ -36,6 +127,79 @@ class VectorStore:
             self.collection = self.client.create_collection(name=self.collection_name)
             print(f"✓ Created new collection: {self.collection_name}")
 
+        # Optional compressed index used for search instead of Chroma's float index
+        self.compression = compression
+        self.pca_dim = pca_dim
+        self.rescore_factor = rescore_factor
+        self.compressed_index = None
+        self.exact_vectors = None
+        if compression:
+            self.load_compressed_index()
+
+    def compressed_index_path(self) -> str:
+        """
+        Path of the compressed index file for this collection
+        """
+        return os.path.join(self.persist_directory, f"{self.collection_name}.compressed.npz")
+
+    def exact_vectors_path(self) -> str:
+        """
+        Path of the memory-mapped full precision vectors used for re-scoring
+        """
+        return os.path.join(self.persist_directory, f"{self.collection_name}.exact.f32")
+
+    def build_compressed_index(self) -> Optional[CompressedIndex]:
+        """
+        Build the compressed index from the exact vector file and save it
+
+        The exact vector file is written by add_documents. Collections built
+        before it existed are exported from Chroma once, which loads Chroma's
+        vector index in this process; serving processes that find both files
+        never touch it.
+
+        Returns:
+            The compressed index, or None if the collection is empty
+        """
+        ids, vectors = load_exact_vectors(self.exact_vectors_path())
+        if len(ids) != self.collection.count():
+            data = self.collection.get(include=['embeddings'])
+            if not data['ids']:
+                return None
+            for path in (self.exact_vectors_path(), exact_ids_path(self.exact_vectors_path())):
+                if os.path.exists(path):
+                    os.remove(path)
+            append_exact_vectors(self.exact_vectors_path(), data['ids'], data['embeddings'])
+            ids, vectors = load_exact_vectors(self.exact_vectors_path())
+        if not ids:
+            return None
+
+        print(f"Building {self.compression} compressed index...")
+        index = CompressedIndex.build(ids, vectors, dtype=self.compression, pca_dim=self.pca_dim)
+        index.save(self.compressed_index_path())
+        self.exact_vectors = vectors
+        print(f"✓ Compressed index built ({index.memory_bytes() / 1024:.1f} KB)")
+        return index
+
+    def load_compressed_index(self) -> None:
+        """
+        Load the compressed index from disk, building it if missing or stale
+        """
+        path = self.compressed_index_path()
+        index = CompressedIndex.load(path) if os.path.exists(path) else None
+
+        # Rebuild when the settings or the collection changed
+        if index is not None:
+            ids, vectors = load_exact_vectors(self.exact_vectors_path())
+            if (index.dtype != self.compression or index.requested_pca_dim != self.pca_dim
+                    or len(index.ids) != self.collection.count() or ids != index.ids):
+                index = None
+            else:
+                self.exact_vectors = vectors
+        if index is None:
+            index = self.build_compressed_index()
+
+        self.compressed_index = index
+
     def create_embeddings(self, texts: List[str]) -> List[List[float]]:
         """
         Create embeddings for a list of texts
@@ -66,19 +230,27 @@ class VectorStore:
 
         # Create embeddings
         print("Creating embeddings...")
-        embeddings = self.create_embeddings(texts)
+        with profiler.stage("embed"):
+            embeddings = self.create_embeddings(texts)
 
         # Add to collection
         print("Storing in Chroma database...")
-        self.collection.add(
-            embeddings=embeddings,
-            documents=texts,
-            metadatas=metadatas,
-            ids=ids
-        )
+        with profiler.stage("store"):
+            self.collection.add(
+                embeddings=embeddings,
+                documents=texts,
+                metadatas=metadatas,
+                ids=ids
+            )
 
         print(f"✓ Successfully added {len(chunks)} documents")
 
+        # Keep the exact vector file (and a served compressed index) in sync
+        if self.compression:
+            append_exact_vectors(self.exact_vectors_path(), ids, embeddings)
+            if self.compressed_index is not None:
+                self.compressed_index = self.build_compressed_index()
+
     def search(self, query: str, n_results: int = 3) -> Dict:
         """
         Search for similar documents
@@ -91,16 +263,60 @@ class VectorStore:
             Dictionary containing search results
         """
         # Create query embedding
-        query_embedding = self.embedding_model.encode([query]).tolist()
+        with profiler.stage("embed"):
+            query_embedding = self.embedding_model.encode([query]).tolist()
+
+        if self.compressed_index is not None:
+            with profiler.stage("search"):
+                return self.search_compressed(query_embedding[0], n_results)
 
         # Search
-        results = self.collection.query(
-            query_embeddings=query_embedding,
-            n_results=n_results
-        )
+        with profiler.stage("search"):
+            results = self.collection.query(
+                query_embeddings=query_embedding,
+                n_results=n_results
+            )
 
         return results
 
+    def search_compressed(self, query_embedding: List[float], n_results: int = 3) -> Dict:
+        """
+        Search the compressed index, optionally re-scoring the top candidates
+        with exact embeddings
+
+        Args:
+            query_embedding: Query embedding
+            n_results: Number of results to return
+
+        Returns:
+            Dictionary containing search results in Chroma's query format
+        """
+        index = self.compressed_index
+        n_candidates = n_results * self.rescore_factor if self.rescore_factor else n_results
+        rows, scores = index.search_rows(query_embedding, n_results=n_candidates)
+
+        if self.rescore_factor and rows and self.exact_vectors is not None:
+            # Only the candidate rows of the memory-mapped file are read
+            exact = rescore(self.exact_vectors[sorted(rows)], query_embedding)
+            ranked = sorted(zip(sorted(rows), exact.tolist()), key=lambda item: -item[1])
+        else:
+            ranked = list(zip(rows, scores))
+        ranked = [(index.ids[row], score) for row, score in ranked[:n_results]]
+
+        # Documents and metadata only; Chroma's vector index is not used
+        ids = [doc_id for doc_id, _ in ranked]
+        data = self.collection.get(ids=ids, include=['documents', 'metadatas'])
+        position = {doc_id: i for i, doc_id in enumerate(data['ids'])}
+        ranked = [(doc_id, score) for doc_id, score in ranked if doc_id in position]
+
+        return {
+            'ids': [[doc_id for doc_id, _ in ranked]],
+            'documents': [[data['documents'][position[doc_id]] for doc_id, _ in ranked]],
+            'metadatas': [[data['metadatas'][position[doc_id]] for doc_id, _ in ranked]],
+            # Cosine distance, so lower is better like Chroma's results
+            'distances': [[1 - score for _, score in ranked]]
+        }
+
     def get_collection_stats(self) -> None:
         """
         Print statistics about the collection
@@ -111,9 +327,13 @@ class VectorStore:
         print("=" * 50)
         print(f"Collection name: {self.collection_name}")
         print(f"Total documents: {count}")
+        if self.compressed_index is not None:
+            print(f"Compressed index: {self.compression} "
+                  f"({self.compressed_index.memory_bytes() / 1024:.1f} KB)")
         print("=" * 50)
 
 
+@profiler.profiled("build_vector_database")
 def build_vector_database():
     """
     Main function to build the vector database
@@ -125,20 +345,33 @@ def build_vector_database():
     # Step 1: Process PDFs
     print("\nStep 1: Processing PDFs...")
     processor = PDFProcessor()
-    chunks = processor.process_all_pdfs()
+    manifest = processor.get_manifest()
+    with profiler.stage("pdf"):
+        chunks = processor.process_all_pdfs()
 
     if not chunks:
         print("Error: No chunks created from PDFs")
         return None
 
-    # Step 2: Create vector store
+    # Step 2: Create a new index generation next to the one being served
     print("\nStep 2: Creating vector store...")
-    vector_store = VectorStore()
+    previous = get_active_generation()
+    vector_store = VectorStore(collection_name=new_generation_name())
 
     # Step 3: Add documents
     vector_store.add_documents(chunks)
 
-    # Step 4: Show stats
+    # Step 4: Point the database at the new generation. The previous one is
+    # kept for a running app; older generations are removed.
+    set_active_generation(vector_store.collection_name, manifest)
+    keep = {vector_store.collection_name}
+    if previous:
+        keep.add(previous['collection'])
+    for name in list_generations(vector_store.client):
+        if name not in keep:
+            delete_generation(vector_store.client, name, vector_store.persist_directory)
+
+    # Step 5: Show stats
     vector_store.get_collection_stats()
 
     return vector_store